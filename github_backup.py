@@ -1,15 +1,21 @@
 import os
+import re
+import shutil
+import argparse
+import asyncio
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-import requests
-import json
-import urllib3
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+import httpx
+import pygit2
+import orjson
 import sys
 import codecs
 import time
-from bs4 import BeautifulSoup
+import lxml.etree
+import lxml.html
+from lxml.cssselect import CSSSelector
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -20,27 +26,98 @@ if sys.platform.startswith('win'):
     sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer, errors='replace')
     sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer, errors='replace')
 
-def create_session():
-    """Create a requests session with retry strategy and SSL verification disabled"""
-    session = requests.Session()
-    retry_strategy = Retry(
-        total=3,
-        backoff_factor=1,
-        status_forcelist=[429, 500, 502, 503, 504],
+# Default number of repositories backed up in parallel. Kept low so that
+# GitHub's abuse detection is not triggered by too many concurrent clones.
+DEFAULT_JOBS = 8
+
+# Parallelism used by git itself (submodule fetches, pack indexing)
+GIT_JOBS = os.cpu_count() or 1
+
+# Absolute path of the git executable, resolved once instead of on every call
+GIT = shutil.which('git') or 'git'
+
+def get_git_version():
+    """Return the installed git version as a tuple of ints, e.g. (2, 39, 5)"""
+    try:
+        result = subprocess.run([GIT, '--version'], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return (0,)
+    match = re.search(r'(\d+)\.(\d+)(?:\.(\d+))?', result.stdout)
+    return tuple(int(part) for part in match.groups(default='0')) if match else (0,)
+
+# Installed git version, detected once at startup before any worker runs
+GIT_VERSION = get_git_version()
+
+# Serialize console output from the backup worker threads
+print_lock = threading.Lock()
+
+def log(*args, **kwargs):
+    """Thread-safe print used by the backup workers"""
+    with print_lock:
+        print(*args, **kwargs)
+
+# Connection pool size for the shared HTTP client
+HTTP_POOL_SIZE = 64
+
+# Responses retried with exponential backoff
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Maximum number of concurrent GitHub API requests
+API_CONCURRENCY = 10
+
+GRAPHQL_URL = "https://api.github.com/graphql"
+
+# Repositories looked up per GraphQL request
+GRAPHQL_BATCH_SIZE = 100
+
+# Repository fields requested from GraphQL
+GRAPHQL_REPO_FIELDS = "name nameWithOwner url diskUsage description"
+
+_client = None
+
+def create_client():
+    """Create an HTTP/2 client with SSL verification disabled.
+
+    No custom transport is passed so that httpx keeps honouring the
+    HTTP(S)_PROXY environment variables; retries are done by get_with_retry.
+    """
+    return httpx.Client(
+        http2=True,  # Multiplex requests to the same host over one connection
+        verify=False,  # Disable SSL verification
+        limits=httpx.Limits(max_connections=HTTP_POOL_SIZE,
+                            max_keepalive_connections=HTTP_POOL_SIZE),
+        follow_redirects=True,
     )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    session.mount("https://", adapter)
-    session.verify = False  # Disable SSL verification
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-    return session
+
+def get_client():
+    """Return the shared client so connections are reused across requests"""
+    global _client
+    if _client is None:
+        _client = create_client()
+    return _client
+
+def get_with_retry(client, url, headers=None, retries=3, backoff=1):
+    """GET a URL, retrying with exponential backoff on connection errors and RETRY_STATUSES"""
+    for attempt in range(retries + 1):
+        try:
+            response = client.get(url, headers=headers)
+        except httpx.TransportError:
+            if attempt == retries:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                return response
+        time.sleep(backoff * 2 ** attempt)
+
+SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB')
 
 def format_size(size_bytes):
     """Convert size in bytes to human readable format"""
-    for unit in ['B', 'KB', 'MB', 'GB']:
-        if size_bytes < 1024.0:
-            return f"{size_bytes:.2f} {unit}"
-        size_bytes /= 1024.0
-    return f"{size_bytes:.2f} TB"
+    if size_bytes <= 0:
+        return "0.00 B"
+    # Each unit is 2**10 times the previous, so the bit length picks the unit
+    i = min((size_bytes.bit_length() - 1) // 10, len(SIZE_UNITS) - 1)
+    return f"{size_bytes / (1 << (10 * i)):.2f} {SIZE_UNITS[i]}"
 
 def get_github_token():
     """Get GitHub token from environment variable or user input"""
@@ -53,8 +130,153 @@ def get_github_token():
         sys.exit(1)
     return token
 
-def get_list_repos(username, list_name):
-    session = create_session()
+def rate_limit_delay(headers, pending=1):
+    """Seconds to wait before the next API request, based on GitHub's rate limit headers.
+
+    There is no delay while the remaining budget covers the pending requests;
+    otherwise the remaining budget is spread evenly until the limit resets.
+    """
+    remaining = headers.get('X-RateLimit-Remaining')
+    reset = headers.get('X-RateLimit-Reset')
+    if remaining is None or reset is None or int(remaining) >= pending:
+        return 0
+    return max(0, (int(reset) - time.time()) / max(int(remaining), 1))
+
+def build_repos_query(repo_paths):
+    """Build a GraphQL query looking up several repositories through aliases"""
+    params = []
+    fields = []
+    variables = {}
+    for i, repo_path in enumerate(repo_paths):
+        owner, name = repo_path.split('/')
+        params.append(f"$o{i}:String!,$n{i}:String!")
+        fields.append(f"r{i}:repository(owner:$o{i},name:$n{i}){{{GRAPHQL_REPO_FIELDS}}}")
+        variables[f"o{i}"] = owner
+        variables[f"n{i}"] = name
+    return f"query({','.join(params)}){{{' '.join(fields)}}}", variables
+
+def parse_repos_result(repo_paths, result):
+    """Map a GraphQL batch result back to REST-style repository details"""
+    # Errors without a path (e.g. RATE_LIMITED) apply to the whole request
+    request_errors = [error.get('message', 'Unknown error')
+                      for error in result.get('errors') or [] if not error.get('path')]
+    if request_errors or result.get('data') is None:
+        raise RuntimeError('; '.join(request_errors) or "GraphQL request returned no data")
+    
+    data = result['data']
+    errors = {error['path'][0]: error['message']
+              for error in result.get('errors') or [] if error.get('path')}
+    details = {}
+    for i, repo_path in enumerate(repo_paths):
+        node = data.get(f"r{i}")
+        if not node:
+            details[repo_path] = LookupError(errors.get(f"r{i}", "Repository not found"))
+            continue
+        details[repo_path] = {
+            'name': node['name'],
+            'full_name': node['nameWithOwner'],
+            'clone_url': f"{node['url']}.git",
+            'size': node['diskUsage'] or 0,  # KB, same unit as the REST size field
+            'description': node['description'],
+        }
+    return details
+
+async def fetch_repo_batch(client, semaphore, repo_paths, headers, pending):
+    """Fetch details for a batch of repositories with a single GraphQL request.
+
+    Failures are returned as the details of every repository in the batch.
+    """
+    query, variables = build_repos_query(repo_paths)
+    payload = {'query': query, 'variables': variables}
+    try:
+        async with semaphore:
+            for attempt in range(2):
+                response = await client.post(GRAPHQL_URL, json=payload, headers=headers)
+                result = response.json() if response.status_code == 200 else {}
+                # Handle rate limiting, reported either as a 403 or as a
+                # RATE_LIMITED error in a 200 response
+                rate_limited = (
+                    (response.status_code == 403 and 'rate limit' in response.text.lower())
+                    or any(error.get('type') == 'RATE_LIMITED'
+                           for error in result.get('errors') or [])
+                )
+                if attempt == 0 and rate_limited:
+                    reset = response.headers.get('X-RateLimit-Reset')
+                    delay = max(int(reset) - time.time(), 1) if reset else 60
+                    print(f"\nRate limit exceeded. Waiting {delay:.0f} seconds before retrying...")
+                    await asyncio.sleep(delay)
+                    continue
+                response.raise_for_status()
+                details = parse_repos_result(repo_paths, result)
+                # Pace the remaining batches when the rate limit budget runs low
+                await asyncio.sleep(rate_limit_delay(response.headers, pending))
+                return details
+    except Exception as e:
+        return dict.fromkeys(repo_paths, e)
+
+async def fetch_repos(repo_paths, headers, on_result):
+    """Fetch repository details in concurrent GraphQL batches, bounded by API_CONCURRENCY.
+
+    on_result(repo_path, details) is called as soon as each batch completes;
+    details is an exception if the repository could not be fetched.
+    """
+    batches = [repo_paths[i:i + GRAPHQL_BATCH_SIZE]
+               for i in range(0, len(repo_paths), GRAPHQL_BATCH_SIZE)]
+    semaphore = asyncio.Semaphore(API_CONCURRENCY)
+    # All batches go to one host, so HTTP/2 carries them as streams on a single connection
+    async with httpx.AsyncClient(http2=True, verify=False) as client:  # SSL verification disabled
+        tasks = [asyncio.create_task(fetch_repo_batch(client, semaphore, batch, headers, len(batches)))
+                 for batch in batches]
+        for next_done in asyncio.as_completed(tasks):
+            for repo_path, details in (await next_done).items():
+                on_result(repo_path, details)
+
+# Repository links on a star list page, compiled once
+REPO_LINK_SELECTOR = CSSSelector('div.d-inline-block.mb-1 h3 a')
+
+# Repository fields kept in the ETag cache
+CACHED_REPO_FIELDS = ('name', 'full_name', 'clone_url', 'size', 'description')
+
+def get_starred_repos(client, username, headers, etag_cache):
+    """Fetch every repository starred by the user, keyed by lower-cased full name.
+
+    Pages are requested with the ETag saved by the previous run; a 304 Not
+    Modified reuses the cached page and does not count against the rate limit.
+    """
+    starred = {}
+    pages = {}
+    url = f"https://api.github.com/users/{username}/starred?per_page=100"
+    while url:
+        cached = etag_cache.get(url)
+        page_headers = dict(headers)
+        if cached:
+            page_headers['If-None-Match'] = cached['etag']
+        response = get_with_retry(client, url, headers=page_headers)
+        if cached and response.status_code == 304:
+            page = cached
+        else:
+            response.raise_for_status()
+            page = {
+                'etag': response.headers.get('ETag'),
+                'next': response.links.get('next', {}).get('url'),
+                'repos': [{field: repo.get(field) for field in CACHED_REPO_FIELDS}
+                          for repo in response.json()],
+            }
+        if page['etag']:
+            pages[url] = page
+        for repo in page['repos']:
+            starred[repo['full_name'].lower()] = repo
+        url = page['next']
+        if url:
+            time.sleep(rate_limit_delay(response.headers))
+    
+    # Only keep pages that still exist
+    etag_cache.clear()
+    etag_cache.update(pages)
+    return starred
+
+def get_list_repos(username, list_name, etag_cache):
+    client = get_client()
     token = get_github_token()
     
     try:
@@ -63,24 +285,24 @@ def get_list_repos(username, list_name):
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
-        response = session.get(list_url, headers=headers)
+        response = get_with_retry(client, list_url, headers=headers)
         response.raise_for_status()
         
-        # Parse the page with BeautifulSoup
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Find all repository divs using the structure you provided
-        repo_items = soup.find_all('div', {'class': 'd-inline-block mb-1'})
+        # Parse the page with lxml and select the repository links in one pass
+        try:
+            repo_links = REPO_LINK_SELECTOR(lxml.html.fromstring(response.content))
+        except lxml.etree.ParserError:
+            # Empty page
+            repo_links = []
         
-        if not repo_items:
+        if not repo_links:
             print(f"No repositories found in list '{list_name}'")
             return []
         
-        print(f"\nFound {len(repo_items)} repositories in list '{list_name}'")
+        print(f"\nFound {len(repo_links)} repositories in list '{list_name}'")
         
         # Get detailed information for each repository
         detailed_repos = []
-        total_size = 0
         
         # Add token to headers for API requests
         api_headers = {
@@ -89,88 +311,109 @@ def get_list_repos(username, list_name):
             'Accept': 'application/vnd.github.v3+json'
         }
         
+        # Collect the "owner/repo" paths from the list page
+        repo_paths = []
+        for repo_link in repo_links:
+            # Get the href which contains the repo path
+            repo_path = repo_link.get('href', '').strip('/')
+            if repo_path.count('/') != 1:
+                print("Could not find repository path")
+                continue
+            repo_paths.append(repo_path)
+        
+        def add_repo(repo_path, repo_details):
+            """Print a repository's details and queue it for backup"""
+            if isinstance(repo_details, Exception):
+                print(f"Error processing repository {repo_path}: {repo_details}")
+                return
+            
+            size_bytes = repo_details.get('size', 0) * 1024  # Convert KB to bytes
+            
+            print(f"Repository: {repo_details['full_name']}")
+            print(f"Size: {format_size(size_bytes)}")
+            
+            # Handle description that might contain emojis
+            description = repo_details.get('description', 'No description')
+            if description:
+                try:
+                    print(f"Description: {description}")
+                except UnicodeEncodeError:
+                    print("Description: [Contains special characters that cannot be displayed]")
+            print("-" * 50)
+            
+            detailed_repos.append({
+                'name': repo_details['name'],
+                'clone_url': repo_details['clone_url'],
+                'size': size_bytes
+            })
+        
         print("\nFetching repository sizes...")
-        for item in repo_items:
-            try:
-                # Find the repository link using the exact structure
-                repo_link = item.find('h3').find('a')
-                if not repo_link:
-                    print("Could not find repository link in item")
-                    continue
-                
-                # Get the href which contains the repo path
-                repo_path = repo_link.get('href', '').strip('/')
-                if not repo_path:
-                    print("Could not find repository path")
-                    continue
-                
-                # The repo path should be in format "owner/repo"
-                owner, repo_name = repo_path.split('/')
-                print(f"\nProcessing repository: {owner}/{repo_name}")
-                
-                # Get repository details from GitHub API
-                api_url = f"https://api.github.com/repos/{owner}/{repo_name}"
-                repo_response = session.get(api_url, headers=api_headers)
-                
-                # Handle rate limiting
-                if repo_response.status_code == 403 and 'rate limit exceeded' in repo_response.text:
-                    print(f"\nRate limit exceeded. Waiting 60 seconds before retrying...")
-                    time.sleep(60)
-                    repo_response = session.get(api_url, headers=api_headers)
-                
-                repo_response.raise_for_status()
-                repo_details = repo_response.json()
-                
-                size_bytes = repo_details.get('size', 0) * 1024  # Convert KB to bytes
-                total_size += size_bytes
-                
-                print(f"Repository: {repo_details['full_name']}")
-                print(f"Size: {format_size(size_bytes)}")
-                
-                # Handle description that might contain emojis
-                description = repo_details.get('description', 'No description')
-                if description:
-                    try:
-                        print(f"Description: {description}")
-                    except UnicodeEncodeError:
-                        print("Description: [Contains special characters that cannot be displayed]")
-                print("-" * 50)
-                
-                detailed_repos.append({
-                    'name': repo_details['name'],
-                    'clone_url': repo_details['clone_url'],
-                    'size': size_bytes
-                })
-                
-                # Add a small delay between requests to avoid hitting rate limits
-                time.sleep(1)
-                
-            except Exception as e:
-                print(f"Error processing repository {owner}/{repo_name if 'repo_name' in locals() else 'unknown'}: {e}")
+        # The starred API returns full repository objects 100 per page, which
+        # covers the list contents without one request per repository
+        starred = get_starred_repos(client, username, api_headers, etag_cache)
         
-        print(f"\nTotal repositories: {len(detailed_repos)}")
-        print(f"Total size: {format_size(total_size)}")
+        missing = []
+        for repo_path in repo_paths:
+            repo_details = starred.get(repo_path.lower())
+            if repo_details:
+                add_repo(repo_path, repo_details)
+            else:
+                missing.append(repo_path)
         
-        while True:
-            try:
-                proceed = input("\nDo you want to proceed with the backup? (y/n): ").strip().lower()
-                if proceed in ['y', 'n']:
-                    break
-                print("Please enter 'y' for yes or 'n' for no.")
-            except EOFError:
-                print("\nInvalid input. Defaulting to 'n'")
-                proceed = 'n'
+        # Look up any list entries that are not starred in batched GraphQL
+        # requests, reporting each batch as soon as it arrives
+        if missing:
+            asyncio.run(fetch_repos(missing, api_headers, add_repo))
         
-        if proceed != 'y':
-            print("Backup cancelled")
-            return []
-            
         return detailed_repos
         
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"Error fetching repositories: {e}")
         return []
 
+def confirm_backup(total_size, count):
+    """Show the backup totals and ask the user whether to proceed"""
+    print(f"\nTotal repositories: {count}")
+    print(f"Total size: {format_size(total_size)}")
+    
+    while True:
+        try:
+            proceed = input("\nDo you want to proceed with the backup? (y/n): ").strip().lower()
+            if proceed in ['y', 'n']:
+                break
+            print("Please enter 'y' for yes or 'n' for no.")
+        except EOFError:
+            print("\nInvalid input. Defaulting to 'n'")
+            proceed = 'n'
+            break
+    return proceed == 'y'
+
+def load_etag_cache(metadata_file):
+    """Load the API ETag cache saved in the previous run's metadata"""
+    try:
+        with open(metadata_file, 'rb') as f:
+            return orjson.loads(f.read()).get('etags', {})
+    except (OSError, orjson.JSONDecodeError):
+        return {}
+
+def get_clone_options():
+    """Return the git clone flags supported by the installed git"""
+    options = ['--single-branch', '--recurse-submodules']
+    if GIT_VERSION >= (2, 19):
+        # Partial clone: full history but blobs are only downloaded for the checkout
+        options.append('--filter=blob:none')
+    if GIT_VERSION >= (2, 9):
+        # Fetch submodules in parallel
+        options += ['--jobs', str(GIT_JOBS), '--shallow-submodules']
+    return options
+
+def get_submodule_update_options():
+    """Return the git submodule update flags supported by the installed git"""
+    if GIT_VERSION >= (2, 9):
+        # Keep submodules shallow and update them in parallel, as on clone
+        return ['--depth', '1', '--jobs', str(GIT_JOBS)]
+    return []
+
 def configure_git():
     """Configure git with optimal settings for large repositories"""
     git_configs = [
@@ -188,40 +431,55 @@ def configure_git():
         ['core.packedGitWindowSize', '512m'], # Increase window size
         ['pack.windowMemory', '512m'],     # Increase pack memory
         ['pack.packSizeLimit', '512m'],    # Increase pack size limit
-        ['pack.threads', '1'],             # Single thread to avoid memory issues
+        ['pack.threads', '0'],             # Auto-detect threads for pack indexing
+        ['submodule.fetchJobs', str(GIT_JOBS)], # Fetch submodules in parallel
     ]
     
     print("Configuring git for large repositories...")
+    # Read the global config once so git is only spawned for values that change
+    result = subprocess.run([GIT, 'config', '--global', '--list'],
+                            capture_output=True, text=True)
+    current = {}
+    for line in result.stdout.splitlines():
+        key, _, value = line.partition('=')
+        current[key.lower()] = value
+    
     for config in git_configs:
+        if current.get(config[0].lower()) == config[1]:
+            continue
         try:
-            subprocess.run(['git', 'config', '--global'] + config, 
+            subprocess.run([GIT, 'config', '--global'] + config, 
                          check=True, 
                          capture_output=True)
             print(f"Set git config {config[0]}={config[1]}")
         except subprocess.CalledProcessError as e:
             print(f"Warning: Could not set git config {config[0]}: {e.stderr}")
 
-def run_git_command(command, retries=3, delay=5):
+def run_git_command(command, retries=3, delay=5, debug=False):
     """Run a git command with retries"""
     for attempt in range(retries):
         try:
             if attempt > 0:
-                print(f"Retry attempt {attempt + 1}/{retries}")
+                log(f"Retry attempt {attempt + 1}/{retries}")
             
-            # Add environment variables for this specific command
+            # Tracing slows every transfer down, so only enable it for debugging
             env = os.environ.copy()
-            env['GIT_TRACE_PACKET'] = '1'
-            env['GIT_TRACE'] = '1'
-            env['GIT_CURL_VERBOSE'] = '1'
+            if debug:
+                env['GIT_TRACE_PACKET'] = '1'
+                env['GIT_TRACE'] = '1'
+                env['GIT_CURL_VERBOSE'] = '1'
             
+            # Only stderr is needed to classify failures; stdout is just
+            # discarded unless debugging so nothing large is buffered
             result = subprocess.run(command,
                                  check=True,
-                                 capture_output=True,
+                                 stdout=subprocess.PIPE if debug else subprocess.DEVNULL,
+                                 stderr=subprocess.PIPE,
                                  text=True,
                                  env=env)
-            return True, result.stdout
+            return True, result.stdout or ""
         except subprocess.CalledProcessError as e:
-            print(f"Attempt {attempt + 1} failed: {e.stderr}")
+            log(f"Attempt {attempt + 1} failed: {e.stderr}")
             if any(err in e.stderr for err in [
                 "unable to access",
                 "Couldn't connect to server",
@@ -230,7 +488,7 @@ def run_git_command(command, retries=3, delay=5):
                 "index-pack failed"
             ]):
                 if attempt < retries - 1:
-                    print(f"Network/transfer issue detected. Waiting {delay} seconds before retry...")
+                    log(f"Network/transfer issue detected. Waiting {delay} seconds before retry...")
                     time.sleep(delay)
                     delay *= 2  # Exponential backoff
                     continue
@@ -239,55 +497,215 @@ def run_git_command(command, retries=3, delay=5):
             return False, str(e)
     return False, "Max retries reached"
 
-def backup_repository(repo_url, backup_dir):
-    """Backup a repository by cloning or pulling if it already exists"""
-    repo_name = repo_url.split('/')[-1]
+def get_local_head(repo_path):
+    """Return the commit checked out in a local repository, or None"""
+    try:
+        return str(pygit2.Repository(repo_path).head.target)
+    except pygit2.GitError:
+        return None
+
+def get_remote_head(repo_path):
+    """Return the commit the origin remote's HEAD points to, or None.
+
+    libgit2 does not use git's credential helpers, so when the in-process
+    lookup fails (e.g. for private repositories) fall back to git ls-remote.
+    """
+    try:
+        remote = pygit2.Repository(repo_path).remotes['origin']
+        for head in remote.list_heads(proxy=True):
+            if head.name == 'HEAD':
+                return str(head.oid)
+    except (pygit2.GitError, KeyError):
+        pass
+    
+    result = subprocess.run([GIT, '-C', repo_path, 'ls-remote', 'origin', 'HEAD'],
+                            capture_output=True, text=True)
+    if result.returncode != 0 or not result.stdout.strip():
+        return None
+    return result.stdout.split()[0]
+
+def scan_backups(backup_dir):
+    """Return the names of the repository directories already in backup_dir"""
+    with os.scandir(backup_dir) as entries:
+        return {entry.name for entry in entries if entry.is_dir()}
+
+# Submodule states that 'git submodule update' has to fix
+STALE_SUBMODULE_STATUS = (pygit2.enums.SubmoduleStatus.WD_UNINITIALIZED
+                          | pygit2.enums.SubmoduleStatus.WD_ADDED
+                          | pygit2.enums.SubmoduleStatus.WD_DELETED
+                          | pygit2.enums.SubmoduleStatus.WD_MODIFIED)
+
+def submodules_need_update(repo_path):
+    """Return True if any submodule is uninitialized or not at its recorded commit"""
+    try:
+        repo = pygit2.Repository(repo_path)
+        for path in repo.listall_submodules():
+            if repo.submodules.status(path) & STALE_SUBMODULE_STATUS:
+                return True
+            if submodules_need_update(os.path.join(repo.workdir, path)):
+                return True
+    except pygit2.GitError:
+        return True
+    return False
+
+def update_submodules(repo_path, debug=False):
+    """Check out the submodule commits recorded in the superproject"""
+    if not os.path.exists(os.path.join(repo_path, '.gitmodules')):
+        return True, ""
+    return run_git_command([GIT, '-C', repo_path, 'submodule', 'update', '--init', '--recursive']
+                           + get_submodule_update_options(), debug=debug)
+
+def get_backup_names(repos):
+    """Map each clone URL to the directory name its backup uses.
+
+    Repositories are stored under their name, except when several owners
+    have a repository with the same name: those are stored as "owner@name"
+    so that parallel workers never share a directory. "@" is not allowed in
+    GitHub owner or repository names, so these names cannot collide with
+    each other or with a plain repository name.
+    """
+    owners = {}
+    for repo in repos:
+        owner, name = repo['clone_url'].split('/')[-2:]
+        owners.setdefault(name.lower(), set()).add(owner.lower())
+    
+    backup_names = {}
+    for repo in repos:
+        owner, name = repo['clone_url'].split('/')[-2:]
+        if len(owners[name.lower()]) > 1:
+            name = f"{owner}@{name}"
+        backup_names[repo['clone_url']] = name
+    return backup_names
+
+def get_origin_url(repo_path):
+    """Return the origin URL of a local repository, or None"""
+    try:
+        return pygit2.Repository(repo_path).remotes['origin'].url
+    except (pygit2.GitError, KeyError):
+        return None
+
+def adopt_shared_backups(backup_dir, repos, existing_repos, backup_names):
+    """Move backups made under a now-shared name to their "owner@name" directory.
+
+    When a second owner's repository with the same name joins the list, the
+    existing backup is renamed after the owner it was cloned from instead of
+    being left behind and cloned again. existing_repos is updated in place.
+    """
+    for repo in repos:
+        old_name = repo['clone_url'].split('/')[-1]
+        new_name = backup_names[repo['clone_url']]
+        if old_name == new_name or old_name not in existing_repos or new_name in existing_repos:
+            continue
+        old_path = os.path.join(backup_dir, old_name)
+        origin_url = get_origin_url(old_path)
+        if not origin_url or origin_url.lower() != repo['clone_url'].lower():
+            continue
+        os.rename(old_path, os.path.join(backup_dir, new_name))
+        existing_repos.discard(old_name)
+        existing_repos.add(new_name)
+        print(f"Moved backup {old_name} to {new_name}")
+
+def prefetch_remote_heads(executor, repos, backup_dir, existing_repos, backup_names):
+    """Start resolving the remote HEAD of every existing backup in the background"""
+    remote_heads = {}
+    for repo in repos:
+        repo_name = backup_names[repo['clone_url']]
+        if repo_name in existing_repos:
+            repo_path = os.path.join(backup_dir, repo_name)
+            remote_heads[repo['clone_url']] = executor.submit(get_remote_head, repo_path)
+    return remote_heads
+
+def backup_repository(repo_url, backup_dir, existing_repos, debug=False, remote_head=None,
+                      repo_name=None):
+    """Backup a repository by cloning, or fetching if it already exists.
+
+    existing_repos is the set of directory names found in backup_dir by
+    scan_backups(); remote_head is an optional future for the remote HEAD
+    prefetched by main(); repo_name is the directory from get_backup_names(),
+    defaulting to the last component of the URL.
+    """
+    repo_name = repo_name or repo_url.split('/')[-1]
     try:
         repo_path = os.path.join(backup_dir, repo_name)
 
-        # Add --depth 1 for initial clone to speed up
-        clone_command = ['git', 'clone', '--depth', '1', repo_url, repo_path]
+        clone_command = [GIT, 'clone'] + get_clone_options() + [repo_url, repo_path]
         
-        if os.path.exists(repo_path):
-            print(f"\nRepository exists, updating: {repo_name}")
-            try:
-                # Try to pull updates
-                success, output = run_git_command(['git', '-C', repo_path, 'pull'])
-                if success:
-                    print(f"Successfully updated {repo_name}")
-                    print(f"Git output: {output}")
-                    return True, "Updated successfully"
-                else:
-                    print(f"Error updating repository {repo_name}: {output}")
-                    # If pull fails, try to remove and clone again
-                    print(f"Attempting to re-clone {repo_name}")
-                    import shutil
-                    shutil.rmtree(repo_path, ignore_errors=True)
-                    success, output = run_git_command(clone_command)
-                    if success:
-                        print(f"Successfully re-cloned {repo_name}")
-                        print(f"Git output: {output}")
-                        return True, "Re-cloned successfully"
-                    else:
-                        return False, f"Failed to re-clone: {output}"
-            except Exception as e:
-                return False, str(e)
+        if repo_name in existing_repos:
+            # Skip the update entirely when the remote has not moved
+            local_head = get_local_head(repo_path)
+            if remote_head:
+                # The prefetch is only an optimization; if it failed, just fetch
+                try:
+                    remote_head = remote_head.result()
+                except Exception:
+                    remote_head = None
+            else:
+                remote_head = get_remote_head(repo_path)
+            if local_head and local_head == remote_head:
+                # Backups made before submodules were updated may still lag
+                # behind; only spawn git when one actually is stale
+                if submodules_need_update(repo_path):
+                    success, output = update_submodules(repo_path, debug)
+                    if not success:
+                        log(f"Error updating submodules of {repo_name}: {output}")
+                        return False, f"Failed to update submodules: {output}"
+                log(f"\nRepository up to date: {repo_name}")
+                return True, "Already up to date"
+            
+            log(f"\nRepository exists, updating: {repo_name}")
+            # Fetch and fast-forward instead of pull: no merge commits, hooks or
+            # index rewrites, and remote branches that are gone are pruned
+            success, output = run_git_command([GIT, '-C', repo_path, 'fetch', '--prune', 'origin'],
+                                              debug=debug)
+            if success:
+                success, output = run_git_command([GIT, '-C', repo_path, 'merge', '--ff-only', '@{upstream}'],
+                                                  debug=debug)
+            if success:
+                # The fast-forward only moves the recorded submodule commits
+                success, output = update_submodules(repo_path, debug)
+            if success:
+                log(f"Successfully updated {repo_name}")
+                if output:
+                    log(f"Git output: {output}")
+                return True, "Updated successfully"
+            else:
+                log(f"Error updating repository {repo_name}: {output}")
+                return False, f"Failed to update: {output}"
         else:
-            print(f"\nCloning new repository: {repo_name}")
-            success, output = run_git_command(clone_command)
+            log(f"\nCloning new repository: {repo_name}")
+            success, output = run_git_command(clone_command, debug=debug)
             if success:
-                print(f"Successfully cloned {repo_name}")
-                print(f"Git output: {output}")
+                log(f"Successfully cloned {repo_name}")
+                if output:
+                    log(f"Git output: {output}")
                 return True, "Cloned successfully"
             else:
                 return False, f"Failed to clone: {output}"
             
     except Exception as e:
         error_msg = str(e)
-        print(f"Unexpected error with repository {repo_name}: {error_msg}")
+        log(f"Unexpected error with repository {repo_name}: {error_msg}")
         return False, error_msg
 
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Back up repositories from a GitHub star list")
+    parser.add_argument('username', nargs='?', default="jing8263xiao",
+                        help="GitHub user owning the list (default: %(default)s)")
+    parser.add_argument('list_name', nargs='?', default="backup",
+                        help="Name of the star list to back up (default: %(default)s)")
+    parser.add_argument('-j', '--jobs', type=int, default=DEFAULT_JOBS,
+                        help="Number of repositories to back up in parallel (default: %(default)s)")
+    parser.add_argument('--debug', action='store_true',
+                        help="Enable git packet/curl tracing for clone and update")
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    return args
+
 def main():
+    args = parse_args()
+
     # Create backups directory if it doesn't exist
     backup_dir = os.path.join(os.getcwd(), 'backups')
     os.makedirs(backup_dir, exist_ok=True)
@@ -296,8 +714,8 @@ def main():
     configure_git()
 
     # Get username and list name from command line arguments or use defaults
-    username = sys.argv[1] if len(sys.argv) > 1 else "jing8263xiao"
-    list_name = sys.argv[2] if len(sys.argv) > 2 else "backup"
+    username = args.username
+    list_name = args.list_name
 
     # Configure git to use system proxy if available
     try:
@@ -308,13 +726,36 @@ def main():
             print("System proxy detected, configuring git...")
             for protocol, proxy in proxy_handler.proxies.items():
                 if protocol in ('http', 'https'):
-                    subprocess.run(['git', 'config', '--global', f'{protocol}.proxy', proxy])
+                    subprocess.run([GIT, 'config', '--global', f'{protocol}.proxy', proxy])
                     print(f"Set {protocol} proxy to: {proxy}")
     except Exception as e:
         print(f"Warning: Could not configure proxy: {e}")
 
-    # Get repositories from the list
-    repos = get_list_repos(username, list_name)
+    # Get repositories from the list, reusing cached API responses where unchanged
+    metadata_file = os.path.join(backup_dir, "backup_metadata.json")
+    etag_cache = load_etag_cache(metadata_file)
+    repos = get_list_repos(username, list_name, etag_cache)
+    
+    # List the existing backups once instead of checking each repository path
+    existing_repos = scan_backups(backup_dir)
+    backup_names = get_backup_names(repos)
+    adopt_shared_backups(backup_dir, repos, existing_repos, backup_names)
+    
+    # One pool runs both the prefetches and the backups, so at most
+    # args.jobs git operations talk to GitHub at any time
+    executor = ThreadPoolExecutor(max_workers=args.jobs)
+    
+    # Resolve the remote HEAD of existing backups while the user decides.
+    # The prefetches are queued first, so a backup waiting on one never
+    # blocks a worker the prefetch itself needs.
+    remote_heads = {}
+    if repos:
+        remote_heads = prefetch_remote_heads(executor, repos, backup_dir,
+                                             existing_repos, backup_names)
+        if not confirm_backup(sum(repo['size'] for repo in repos), len(repos)):
+            executor.shutdown(wait=False, cancel_futures=True)
+            print("Backup cancelled")
+            repos = []
 
     # Initialize counters and lists for summary
     successful_repos = []
@@ -322,13 +763,29 @@ def main():
     
     # Backup each repository
     if repos:
-        print("\nStarting backup process...")
-        for repo in repos:
-            success, message = backup_repository(repo['clone_url'], backup_dir)
-            if success:
-                successful_repos.append(repo['name'])
-            else:
-                failed_repos.append((repo['name'], message))
+        print(f"\nStarting backup process ({args.jobs} parallel jobs)...")
+        # One JSON line per finished repository; unbuffered so it can be followed with tail -f
+        log_file = os.path.join(backup_dir, "backup_log.jsonl")
+        with open(log_file, 'ab', buffering=0) as backup_log, executor:
+            futures = {
+                executor.submit(backup_repository, repo['clone_url'], backup_dir, existing_repos,
+                                args.debug, remote_heads.get(repo['clone_url']),
+                                backup_names[repo['clone_url']]): repo
+                for repo in repos
+            }
+            for future in as_completed(futures):
+                repo = futures[future]
+                success, message = future.result()
+                backup_log.write(orjson.dumps({
+                    "repo": repo['name'],
+                    "ok": success,
+                    "ts": time.time(),
+                    "msg": message
+                }) + b"\n")
+                if success:
+                    successful_repos.append(repo['name'])
+                else:
+                    failed_repos.append((repo['name'], message))
         
         # Print summary
         print("\n" + "="*50)
@@ -355,18 +812,18 @@ def main():
 
     # Save backup metadata
     metadata = {
-        "last_backup": datetime.now().isoformat(),
+        "last_backup": datetime.now(),
         "successful_repos": successful_repos,
         "failed_repos": [(name, str(error)) for name, error in failed_repos],
         "total_repos": len(repos),
         "success_count": len(successful_repos),
-        "fail_count": len(failed_repos)
+        "fail_count": len(failed_repos),
+        "etags": etag_cache
     }
     
     # Save metadata to file
-    metadata_file = os.path.join(backup_dir, "backup_metadata.json")
-    with open(metadata_file, 'w') as f:
-        json.dump(metadata, f, indent=2)
+    with open(metadata_file, 'wb') as f:
+        f.write(orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
     print(f"\nBackup metadata saved to {metadata_file}")
 
 if __name__ == "__main__":